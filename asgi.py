@@ -0,0 +1,139 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+import boat
+import constants
+import load
+from main import app
+
+# views run as coroutines on the event loop, by endpoint and method
+async_views = {
+    ('boat.boat_get_post', 'GET'): boat.boat_get_async,
+    ('boat.add_delete_load_to_boat', 'PATCH'): boat.add_delete_load_to_boat_async,
+    ('boat.add_delete_load_to_boat', 'DELETE'): boat.add_delete_load_to_boat_async,
+    ('load.load_get_post', 'GET'): load.load_get_async,
+}
+
+# pool that runs every other route through the WSGI app
+executor = ThreadPoolExecutor(max_workers=constants.ASGI_WORKERS, thread_name_prefix='asgi')
+
+
+# ASGI entry point, run with 'uvicorn asgi:asgi_app'
+async def asgi_app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError("Unsupported ASGI scope type " + scope['type'])
+    environ = _build_environ(scope, await _read_body(receive))
+    view = _match_async_view(environ)
+    if view:
+        status, headers, body = await _call_async_view(environ, *view)
+    else:
+        status, headers, body = await asyncio.get_running_loop().run_in_executor(executor, _call_wsgi, environ)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# acknowledge server startup and shutdown
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# read the whole request body
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+# build a WSGI environ from an ASGI http scope and body
+def _build_environ(scope, body):
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope['http_version'],
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+# find the async view for the request, None if the route is served by the WSGI app
+def _match_async_view(environ):
+    try:
+        endpoint, view_args = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    view = async_views.get((endpoint, environ['REQUEST_METHOD']))
+    return (view, view_args) if view else None
+
+
+# run an async view in a Flask request context and return its status, headers, and body
+async def _call_async_view(environ, view, view_args):
+    with app.request_context(environ):
+        try:
+            rv = await view(**view_args)
+        except HTTPException as e:
+            rv = app.handle_user_exception(e)
+        except Exception as e:
+            rv = app.handle_exception(e)
+        res = app.make_response(rv)
+        return res.status_code, _asgi_headers(res.headers.items()), res.get_data()
+
+
+# run the WSGI app and return its status, headers, and body
+def _call_wsgi(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = _asgi_headers(headers)
+    result = app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
@@ -0,0 +1,97 @@
+import asyncio
+import httpx
+from google.api_core import exceptions
+from flask import abort, request
+import async_storage
+import constants
+import helpers
+
+client = async_storage.AsyncClient()
+
+# refresh of the known jwts in progress
+_jwks_refresh = {'task': None}
+
+
+# get known jwts, one caller refreshes a stale copy while the others keep using it
+async def get_jwks(force=False):
+    if not helpers.jwks_stale(force):
+        return helpers.jwks_cache['jwks']
+    task = _jwks_refresh['task']
+    if task is None or task.done():
+        task = asyncio.ensure_future(_fetch_jwks())
+        _jwks_refresh['task'] = task
+    # wait for the refresh only if there is no copy yet or the cached keys are known to be wrong
+    if helpers.jwks_cache['jwks'] is None or force:
+        return await asyncio.shield(task)
+    return helpers.jwks_cache['jwks']
+
+
+# fetch known jwts without blocking the event loop
+async def _fetch_jwks():
+    try:
+        async with httpx.AsyncClient(timeout=constants.JWKS_TIMEOUT) as http:
+            res = await http.get(helpers.JWKS_URL)
+            res.raise_for_status()
+            return helpers.store_jwks(res.json())
+    except (httpx.HTTPError, ValueError):
+        # keep using the old copy if the refresh fails
+        if helpers.jwks_cache['jwks'] is None:
+            raise
+        return helpers.jwks_cache['jwks']
+
+
+# check if jwt is valid
+async def verify_jwt(request):
+    token = helpers.get_token(request)
+    unverified_header = helpers.get_unverified_header(token)
+    rsa_key = helpers.find_rsa_key(await get_jwks(), unverified_header.get('kid'))
+    # refetch known jwts in case the signing keys were rotated
+    if not rsa_key:
+        rsa_key = helpers.find_rsa_key(await get_jwks(force=True), unverified_header.get('kid'))
+    return helpers.decode_jwt(token, rsa_key)
+
+
+# find the user id that matches the given sub
+async def get_user_id_from_sub(sub):
+    results, _ = await client.query(constants.users, filter=('sub', '=', sub))
+    return results[0].id
+
+
+# check if the user at usr_id matches sub, pass a transaction to read the user in it
+async def check_auth(usr_id, sub, txn=None):
+    usr_key = client.key(constants.users, usr_id)
+    usr = await (txn or client).get(usr_key)
+    if sub != usr.get('sub'):
+        abort(403, description="You are not authorized to access this resource")
+
+
+# Get filtered and paginated list of items
+async def fetch_filtered_and_paginated_list(item_kind, limit=constants.MAX_LIMIT, offset=0, filter=()):
+    # fetch the page and count total items concurrently
+    (results, more), total = await asyncio.gather(client.query(item_kind, filter, limit, offset),
+                                                  client.count(item_kind, filter))
+    output = {item_kind: results}
+    # get next link and total items count
+    if more:
+        next_url = request.base_url + "?limit=" + str(limit) + "&offset=" + str(offset + limit)
+        output['next'] = next_url
+    output['total'] = total
+    return output
+
+
+# run func(txn, *args) in a transaction on txn_client, retrying with backoff and jitter on contention
+async def run_in_transaction(txn_client, route, func, *args):
+    for attempt in range(constants.TXN_MAX_ATTEMPTS):
+        try:
+            async with txn_client.transaction() as txn:
+                result = await func(txn, *args)
+            helpers.count_txn(route, 'commits')
+            return result
+        except (exceptions.Conflict, exceptions.Aborted):
+            helpers.count_txn(route, 'conflicts')
+            if attempt + 1 == constants.TXN_MAX_ATTEMPTS:
+                break
+            helpers.count_txn(route, 'retries')
+            await asyncio.sleep(helpers.txn_backoff(attempt))
+    helpers.count_txn(route, 'failures')
+    abort(409, description="Request conflicted with a concurrent update, try again")
@@ -0,0 +1,145 @@
+import os
+import grpc
+from google.api_core import exceptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import datastore
+from google.cloud.datastore import helpers as ds_helpers
+from google.cloud.datastore_v1.services.datastore import DatastoreAsyncClient
+from google.cloud.datastore_v1.services.datastore.transports import DatastoreGrpcAsyncIOTransport
+from google.cloud.datastore_v1.types import datastore as datastore_pb
+from google.cloud.datastore_v1.types import entity as entity_pb
+from google.cloud.datastore_v1.types import query as query_pb
+import helpers
+
+_NO_MORE_RESULTS = query_pb.QueryResultBatch.MoreResultsType.NO_MORE_RESULTS
+_OPERATORS = {'=': query_pb.PropertyFilter.Operator.EQUAL}
+
+
+# async datastore client for the routes served natively by the ASGI app
+class AsyncClient:
+    def __init__(self, project=None):
+        self._project = project
+        self._api = None
+
+    @property
+    def project(self):
+        # share the project of the sync client
+        if self._project is None:
+            self._project = helpers.client.project
+        return self._project
+
+    # create the grpc client lazily so it binds to the running event loop
+    @property
+    def api(self):
+        if self._api is None:
+            emulator_host = os.environ.get('DATASTORE_EMULATOR_HOST')
+            if emulator_host:
+                transport = DatastoreGrpcAsyncIOTransport(channel=grpc.aio.insecure_channel(emulator_host),
+                                                          credentials=AnonymousCredentials())
+                self._api = DatastoreAsyncClient(transport=transport)
+            else:
+                self._api = DatastoreAsyncClient()
+        return self._api
+
+    def key(self, kind, id):
+        return datastore.Key(kind, id, project=self.project)
+
+    # get the entities at keys, missing entities are left out
+    async def get_multi(self, keys, transaction=None):
+        read_options = datastore_pb.ReadOptions(transaction=transaction) if transaction else None
+        key_pbs = [key.to_protobuf() for key in keys]
+        found = []
+        # datastore may defer some keys to a later lookup
+        while key_pbs:
+            res = await self.api.lookup(request=datastore_pb.LookupRequest(
+                project_id=self.project, keys=key_pbs, read_options=read_options))
+            found.extend(ds_helpers.entity_from_protobuf(result.entity) for result in res.found)
+            key_pbs = list(res.deferred)
+        return found
+
+    async def get(self, key, transaction=None):
+        found = await self.get_multi([key], transaction)
+        return found[0] if found else None
+
+    # get a page of entities of kind matching filter, and whether more results follow
+    async def query(self, kind, filter=(), limit=None, offset=0):
+        query = _query_pb(kind, filter)
+        if limit is not None:
+            query.limit = limit
+        query.offset = offset
+        res = await self.api.run_query(request=datastore_pb.RunQueryRequest(project_id=self.project, query=query))
+        entities = [ds_helpers.entity_from_protobuf(result.entity) for result in res.batch.entity_results]
+        return entities, res.batch.more_results != _NO_MORE_RESULTS
+
+    # count entities of kind matching filter with an aggregation query
+    async def count(self, kind, filter=()):
+        aggregation = query_pb.AggregationQuery(
+            nested_query=_query_pb(kind, filter),
+            aggregations=[query_pb.AggregationQuery.Aggregation(
+                alias='total', count=query_pb.AggregationQuery.Aggregation.Count())])
+        res = await self.api.run_aggregation_query(request=datastore_pb.RunAggregationQueryRequest(
+            project_id=self.project, aggregation_query=aggregation))
+        return res.batch.aggregation_results[0].aggregate_properties['total'].integer_value
+
+    def transaction(self):
+        return AsyncTransaction(self)
+
+
+# transaction used with 'async with', writes are sent when it commits
+class AsyncTransaction:
+    def __init__(self, client):
+        self._client = client
+        self._id = None
+        self._mutations = []
+
+    async def __aenter__(self):
+        res = await self._client.api.begin_transaction(
+            request=datastore_pb.BeginTransactionRequest(project_id=self._client.project))
+        self._id = res.transaction
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # the original error matters more than a failed rollback
+            try:
+                await self._client.api.rollback(
+                    request=datastore_pb.RollbackRequest(project_id=self._client.project, transaction=self._id))
+            except exceptions.GoogleAPICallError:
+                pass
+            return False
+        await self._client.api.commit(request=datastore_pb.CommitRequest(
+            project_id=self._client.project, mode=datastore_pb.CommitRequest.Mode.TRANSACTIONAL,
+            transaction=self._id, mutations=self._mutations))
+        return False
+
+    async def get_multi(self, keys):
+        return await self._client.get_multi(keys, transaction=self._id)
+
+    async def get(self, key):
+        return await self._client.get(key, transaction=self._id)
+
+    def put(self, entity):
+        self._mutations.append(datastore_pb.Mutation(upsert=ds_helpers.entity_to_protobuf(entity)))
+
+    def delete(self, key):
+        self._mutations.append(datastore_pb.Mutation(delete=key.to_protobuf()))
+
+
+# build a query for kind with an optional (property, operator, value) filter
+def _query_pb(kind, filter=()):
+    query = query_pb.Query(kind=[query_pb.KindExpression(name=kind)])
+    if filter:
+        query.filter = query_pb.Filter(property_filter=query_pb.PropertyFilter(
+            property=query_pb.PropertyReference(name=filter[0]),
+            op=_OPERATORS[filter[1]],
+            value=_value_pb(filter[2])))
+    return query
+
+
+# convert a filter value to its protobuf
+def _value_pb(value):
+    if isinstance(value, bool):
+        return entity_pb.Value(boolean_value=value)
+    if isinstance(value, int):
+        return entity_pb.Value(integer_value=value)
+    return entity_pb.Value(string_value=value)
@@ -2,3 +2,5 @@ AUTH0_CLIENT_ID = 'mzG1voQLCvWxd0dwsL7AxWnqew41n1jm'
 AUTH0_CLIENT_SECRET = ''
 AUTH0_DOMAIN = 'cs493-portfolio-andemar3.us.auth0.com'
 APP_SECRET_KEY = ''
+ADMIN_SUBS = []
+PROFILE_SECRET = ''
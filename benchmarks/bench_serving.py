@@ -0,0 +1,111 @@
+"""Compare GET /boats throughput of the WSGI and ASGI serving modes.
+
+Datastore calls go to the in-memory fake clients used by the tests, which
+wait LATENCY seconds per call, and jwt verification is skipped, so the
+numbers show how many requests each mode keeps in flight rather than real
+Datastore cost. The WSGI mode uses the sync fake, the ASGI mode serves
+GET /boats from its async view on the async fake.
+
+Run from the Simple Rest API directory with 'python benchmarks/bench_serving.py'.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:1')
+os.environ.setdefault('DATASTORE_DATASET', 'test')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'test')
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'tests'))
+
+import uvicorn
+from werkzeug.serving import make_server
+from fake_datastore import FakeAsyncClient, FakeClient, FakeStore
+import asgi
+import async_helpers
+import constants
+import helpers
+import main
+
+LATENCY = 0.02
+CONCURRENCY = [1, 16, 64, 256]
+REQUESTS_PER_CLIENT = 10
+BOATS = 20
+
+
+# fill a store with one user owning BOATS boats
+def make_store():
+    store = FakeStore()
+    client = FakeClient(store)
+    usr = client.create(constants.users, {'name': 'bench', 'sub': 'bench-sub'})
+    for _ in range(BOATS):
+        client.create(constants.boats, {'name': 'b', 'type': 't', 'length': 1, 'owner': usr.id, 'loads': []})
+    return store
+
+
+def run_wsgi(port):
+    server = make_server('127.0.0.1', port, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def run_asgi(port):
+    server = uvicorn.Server(uvicorn.Config(asgi.asgi_app, host='127.0.0.1', port=port, log_level='warning',
+                                           backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return stop
+
+
+# send requests from concurrency clients and return requests per second
+def measure(port, concurrency):
+    url = 'http://127.0.0.1:%d/boats' % port
+
+    def client(_):
+        for _ in range(REQUESTS_PER_CLIENT):
+            req = urllib.request.Request(url, headers={'Accept': constants.json})
+            with urllib.request.urlopen(req) as res:
+                assert res.status == 200
+                res.read()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return concurrency * REQUESTS_PER_CLIENT / (time.perf_counter() - start)
+
+
+def main_bench():
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    store = make_store()
+    helpers.client = FakeClient(store, latency=LATENCY)
+    async_helpers.client = FakeAsyncClient(store, latency=LATENCY)
+    helpers.verify_jwt = lambda req: {'sub': 'bench-sub'}
+
+    async def verify_jwt(req):
+        return {'sub': 'bench-sub'}
+    async_helpers.verify_jwt = verify_jwt
+    modes = [
+        ('wsgi (werkzeug threaded)', run_wsgi),
+        ('asgi (asgi.asgi_app)', run_asgi),
+    ]
+    print('%-26s' % 'mode' + ''.join('%14s' % ('c=%d req/s' % c) for c in CONCURRENCY))
+    for i, (name, start) in enumerate(modes):
+        port = 8090 + i
+        stop = start(port)
+        rates = [measure(port, c) for c in CONCURRENCY]
+        stop()
+        print('%-26s' % name + ''.join('%14.1f' % r for r in rates))
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,65 @@
+"""Measure load attach throughput as the number of parallel clients grows.
+
+Attaches run through helpers.run_in_transaction with the production
+TXN_* retry settings against the in-memory fake client used by the
+tests, so the numbers show the cost of contention and backoff on one
+boat rather than real Datastore latency.
+
+Run from the Simple Rest API directory with 'python benchmarks/bench_transactions.py'.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:1')
+os.environ.setdefault('DATASTORE_DATASET', 'test')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'test')
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'tests'))
+
+from werkzeug.exceptions import HTTPException
+from fake_datastore import FakeClient, FakeStore
+import boat
+import constants
+import helpers
+
+PARALLELISM = [1, 8, 32, 128]
+LOADS = 512
+
+
+# attach LOADS loads to one boat from parallel clients, returning attaches per second and 409 count
+def measure(parallel):
+    store = FakeStore()
+    boat.client = FakeClient(store)
+    helpers.client = FakeClient(store)
+    helpers.txn_stats = {}
+    usr = boat.client.create(constants.users, {'name': 'bench', 'sub': 'bench-sub'})
+    b = boat.client.create(constants.boats, {'name': 'b', 'type': 't', 'length': 1, 'owner': usr.id, 'loads': []})
+    loads = [boat.client.create(constants.loads, {'item': 'i', 'volume': 1, 'weight': 1, 'boat': None})
+             for _ in range(LOADS)]
+
+    def attach(load):
+        try:
+            helpers.run_in_transaction(boat.client, 'attach', boat._attach_load, b.id, load.id, 'bench-sub')
+        except HTTPException as e:
+            return e.code
+        return 204
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        codes = list(pool.map(attach, loads))
+    elapsed = time.perf_counter() - start
+    assert len(boat.client.get(b.key)['loads']) == codes.count(204)
+    return LOADS / elapsed, codes.count(409), helpers.get_txn_stats()['attach']['retries']
+
+
+def main():
+    print('%10s%14s%8s%10s' % ('parallel', 'attaches/s', '409s', 'retries'))
+    for parallel in PARALLELISM:
+        rate, conflicts, retries = measure(parallel)
+        print('%10d%14.1f%8d%10d' % (parallel, rate, conflicts, retries))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 from flask import abort, Blueprint, request
 from google.cloud import datastore
+import async_helpers
+import async_storage
 import constants
 import helpers
 
 client = datastore.Client()
+async_client = async_storage.AsyncClient()
 
 bp = Blueprint('boat', __name__, url_prefix='/boats')
 
@@ -60,19 +63,11 @@ def boat_patch_delete(boat_id):
         # check that request content is json and accepts json response
         helpers.check_req_content_is_json(request)
         helpers.check_accepts_json_res(request)
-        # verify jwt and get boat
+        # verify jwt
         token = helpers.verify_jwt(request)
-        boat_key = client.key(constants.boats, int(boat_id))
-        boat = client.get(key=boat_key)
-        # check boat exists
-        if not boat:
-            abort(404, description="Load not found")
-        # check that boat belongs to the user
-        helpers.check_auth(boat.get('owner'), token.get('sub'))
         content = request.get_json()
-        # edit and put boat
-        boat = _update_boat_content(content, boat)
-        client.put(boat)
+        # read and write boat in one transaction
+        boat = helpers.run_in_transaction(client, 'edit_boat', _edit_boat, boat_id, content, token.get('sub'))
         # return edited boat with ids and self links
         boat = _add_ids_and_self_links(boat)
         return helpers.create_response(boat, 200, constants.json)
@@ -81,105 +76,228 @@ def boat_patch_delete(boat_id):
         # check that request content is json and accepts json response
         helpers.check_req_content_is_json(request)
         helpers.check_accepts_json_res(request)
-        # verify jwt and get boat
+        # verify jwt
         token = helpers.verify_jwt(request)
-        boat_key = client.key(constants.boats, int(boat_id))
-        boat = client.get(key=boat_key)
-        # check boat exists
-        if not boat:
-            abort(404, description="Boat not found")
-        # check that boat belongs to the user
-        helpers.check_auth(boat.get('owner'), token.get('sub'))
         content = request.get_json()
-        # check that boat belongs to the user
-        _verify_boat_content(content)
-        boat = _update_boat_content(content, boat)
-        # unload loads from boat
-        _unload_loads(boat)
-        boat.update({'loads': []})
-        client.put(boat)
+        # read and write boat and its loads in one transaction
+        boat = helpers.run_in_transaction(client, 'replace_boat', _replace_boat, boat_id, content, token.get('sub'))
         # return replaced boat with ids and self links
         boat = _add_ids_and_self_links(boat)
         return helpers.create_response(boat, 201, constants.json)
     # Delete boat
     elif request.method == 'DELETE':
-        # verify jwt and get boat
+        # verify jwt
         token = helpers.verify_jwt(request)
-        boat_key = client.key(constants.boats, int(boat_id))
-        boat = client.get(key=boat_key)
-        # check boat exists
-        if not boat:
-            abort(404, description="Boat not found")
-        # verify boat belongs to user
-        helpers.check_auth(boat.get('owner'), token['sub'])
-        # unload all loads and delete boat
-        _unload_loads(boat)
-        client.delete(boat_key)
+        # unload loads and delete boat in one transaction
+        helpers.run_in_transaction(client, 'delete_boat', _delete_boat, boat_id, token['sub'])
         return helpers.create_response(None, 204, None)
     else:
         abort(405, description="Method Not Allowed")
 
 
+# edit boat, must be run inside a transaction
+def _edit_boat(boat_id, content, sub):
+    # get boat
+    boat_key = client.key(constants.boats, int(boat_id))
+    boat = client.get(key=boat_key)
+    # check boat exists
+    if not boat:
+        abort(404, description="Boat not found")
+    # check that boat belongs to the user
+    helpers.check_auth(boat.get('owner'), sub, client)
+    # edit and put boat
+    boat = _update_boat_content(content, boat)
+    client.put(boat)
+    return boat
+
+
+# replace boat and unload its loads, must be run inside a transaction
+def _replace_boat(boat_id, content, sub):
+    # get boat
+    boat_key = client.key(constants.boats, int(boat_id))
+    boat = client.get(key=boat_key)
+    # check boat exists
+    if not boat:
+        abort(404, description="Boat not found")
+    # check that boat belongs to the user
+    helpers.check_auth(boat.get('owner'), sub, client)
+    # verify content and replace boat
+    _verify_boat_content(content)
+    boat = _update_boat_content(content, boat)
+    # unload loads from boat
+    _unload_loads(boat)
+    boat.update({'loads': []})
+    client.put(boat)
+    return boat
+
+
+# unload loads and delete boat, must be run inside a transaction
+def _delete_boat(boat_id, sub):
+    # get boat
+    boat_key = client.key(constants.boats, int(boat_id))
+    boat = client.get(key=boat_key)
+    # check boat exists
+    if not boat:
+        abort(404, description="Boat not found")
+    # verify boat belongs to user
+    helpers.check_auth(boat.get('owner'), sub, client)
+    # unload all loads and delete boat
+    _unload_loads(boat)
+    client.delete(boat_key)
+
+
 @bp.route('/<boat_id>/<load_id>', methods=['PATCH', 'DELETE'])
 def add_delete_load_to_boat(boat_id, load_id):
     # Add load to boat
     if request.method == 'PATCH':
         # get token
         token = helpers.verify_jwt(request)
-        # get boat
-        boat_key = client.key(constants.boats, int(boat_id))
-        boat = client.get(key=boat_key)
-        # check boat exists
-        if not boat:
-            abort(404, description="Boat not found")
-        # check boat auth
-        helpers.check_auth(boat.get('owner'), token['sub'])
-        # get load
-        load_key = client.key(constants.loads, int(load_id))
-        load = client.get(key=load_key)
-        # check load exists and is not on a boat
-        if not load:
-            abort(404, description="Load not found")
-        if load.get('boat'):
-            abort(403, description="Load is already on a boat")
-        # put load on boat
-        load.update({'boat': {'id': int(boat_id)}})
-        loads = boat.get('loads')
-        loads.append({'id': int(load_id)})
-        boat.update({'loads': loads})
-        client.put(load)
-        client.put(boat)
+        # read and write boat and load in one transaction
+        helpers.run_in_transaction(client, 'attach', _attach_load, boat_id, load_id, token['sub'])
         return helpers.create_response(None, 204, None)
     elif request.method == 'DELETE':
         # get token
         token = helpers.verify_jwt(request)
-        # get boat
-        boat_key = client.key(constants.boats, int(boat_id))
-        boat = client.get(key=boat_key)
-        if not boat:
-            abort(404, description="Boat not found")
-        # check boat auth
-        helpers.check_auth(boat.get('owner'), token['sub'])
-        # get load
-        load_key = client.key(constants.loads, int(load_id))
-        load = client.get(key=load_key)
-        # check load exists and is on the boat
-        if not load:
-            abort(404, description="Load not found")
-        if not _check_load_on_boat(boat, load):
-            abort(404, description="Load is not on this boat")
-        # remove load from boat
-        load.update({'boat': None})
-        loads = boat.get('loads')
-        loads.remove({'id': int(load_id)})
-        boat.update({'loads': loads})
-        client.put(load)
-        client.put(boat)
+        # read and write boat and load in one transaction
+        helpers.run_in_transaction(client, 'detach', _detach_load, boat_id, load_id, token['sub'])
         return helpers.create_response(None, 204, None)
     else:
         abort(405, description="Method Not Allowed")
 
 
+# put load on boat, must be run inside a transaction
+def _attach_load(boat_id, load_id, sub):
+    # get boat and load
+    boat, load = _get_boat_and_load(boat_id, load_id)
+    # check boat exists
+    if not boat:
+        abort(404, description="Boat not found")
+    # check boat auth
+    helpers.check_auth(boat.get('owner'), sub, client)
+    _put_load_on_boat(boat, load, boat_id, load_id)
+    client.put(load)
+    client.put(boat)
+
+
+# remove load from boat, must be run inside a transaction
+def _detach_load(boat_id, load_id, sub):
+    # get boat and load
+    boat, load = _get_boat_and_load(boat_id, load_id)
+    if not boat:
+        abort(404, description="Boat not found")
+    # check boat auth
+    helpers.check_auth(boat.get('owner'), sub, client)
+    _take_load_off_boat(boat, load, load_id)
+    client.put(load)
+    client.put(boat)
+
+
+# check load exists and is not on a boat, then put it on the boat
+def _put_load_on_boat(boat, load, boat_id, load_id):
+    if not load:
+        abort(404, description="Load not found")
+    if load.get('boat'):
+        abort(403, description="Load is already on a boat")
+    load.update({'boat': {'id': int(boat_id)}})
+    loads = boat.get('loads')
+    loads.append({'id': int(load_id)})
+    boat.update({'loads': loads})
+
+
+# check load exists and is on the boat, then remove it from the boat
+def _take_load_off_boat(boat, load, load_id):
+    if not load:
+        abort(404, description="Load not found")
+    if not _check_load_on_boat(boat, load):
+        abort(404, description="Load is not on this boat")
+    load.update({'boat': None})
+    loads = boat.get('loads')
+    loads.remove({'id': int(load_id)})
+    boat.update({'loads': loads})
+
+
+# get boat and load in a single lookup, either is None if not found
+def _get_boat_and_load(boat_id, load_id):
+    boat_key = client.key(constants.boats, int(boat_id))
+    load_key = client.key(constants.loads, int(load_id))
+    found = {entity.key: entity for entity in client.get_multi([boat_key, load_key])}
+    return found.get(boat_key), found.get(load_key)
+
+
+# GET /boats for the ASGI serving mode
+async def boat_get_async():
+    # check that json response is accepted
+    helpers.check_accepts_json_res(request)
+    # verify jwt and get limit and offset from args
+    token = await async_helpers.verify_jwt(request)
+    q_limit = int(request.args.get('limit', str(constants.MAX_LIMIT)))
+    q_offset = int(request.args.get('offset', '0'))
+    user_id = await async_helpers.get_user_id_from_sub(token.get('sub'))
+    # get paginated list of all boats belonging to the user
+    results = await async_helpers.fetch_filtered_and_paginated_list(constants.boats, limit=q_limit,
+                                                                    offset=q_offset, filter=('owner', '=', user_id))
+    # add ids and self links
+    for boat in results.get('boats'):
+        boat = _add_ids_and_self_links(boat)
+    return helpers.create_response(results, 200, constants.json)
+
+
+# PATCH and DELETE /boats/<boat_id>/<load_id> for the ASGI serving mode
+async def add_delete_load_to_boat_async(boat_id, load_id):
+    # Add load to boat
+    if request.method == 'PATCH':
+        # get token
+        token = await async_helpers.verify_jwt(request)
+        # read and write boat and load in one transaction
+        await async_helpers.run_in_transaction(async_client, 'attach', _attach_load_async,
+                                               boat_id, load_id, token['sub'])
+        return helpers.create_response(None, 204, None)
+    elif request.method == 'DELETE':
+        # get token
+        token = await async_helpers.verify_jwt(request)
+        # read and write boat and load in one transaction
+        await async_helpers.run_in_transaction(async_client, 'detach', _detach_load_async,
+                                               boat_id, load_id, token['sub'])
+        return helpers.create_response(None, 204, None)
+    else:
+        abort(405, description="Method Not Allowed")
+
+
+# put load on boat in txn
+async def _attach_load_async(txn, boat_id, load_id, sub):
+    # get boat and load
+    boat, load = await _get_boat_and_load_async(txn, boat_id, load_id)
+    # check boat exists
+    if not boat:
+        abort(404, description="Boat not found")
+    # check boat auth
+    await async_helpers.check_auth(boat.get('owner'), sub, txn)
+    _put_load_on_boat(boat, load, boat_id, load_id)
+    txn.put(load)
+    txn.put(boat)
+
+
+# remove load from boat in txn
+async def _detach_load_async(txn, boat_id, load_id, sub):
+    # get boat and load
+    boat, load = await _get_boat_and_load_async(txn, boat_id, load_id)
+    if not boat:
+        abort(404, description="Boat not found")
+    # check boat auth
+    await async_helpers.check_auth(boat.get('owner'), sub, txn)
+    _take_load_off_boat(boat, load, load_id)
+    txn.put(load)
+    txn.put(boat)
+
+
+# get boat and load in a single lookup in txn, either is None if not found
+async def _get_boat_and_load_async(txn, boat_id, load_id):
+    boat_key = async_client.key(constants.boats, int(boat_id))
+    load_key = async_client.key(constants.loads, int(load_id))
+    found = {entity.key: entity for entity in await txn.get_multi([boat_key, load_key])}
+    return found.get(boat_key), found.get(load_key)
+
+
 # unload all loads from boat
 def _unload_loads(boat):
     if boat.get('loads'):
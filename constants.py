@@ -7,3 +7,15 @@ res_406 = {'Error': 'Server cannot return requested media type'}
 res_unique_name = {'Error': 'This name is not unique'}
 res_404 = {'Error': 'Item not found'}
 MAX_LIMIT = 5
+TXN_MAX_ATTEMPTS = 10
+TXN_BASE_BACKOFF = 0.05
+TXN_MAX_BACKOFF = 1.0
+PROFILE_ENABLED = False
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_HEADER = 'X-Profile-Request'
+PROFILE_INTERVAL = 0.005
+IO_WORKERS = 16
+JWKS_TTL = 600
+JWKS_MIN_REFRESH = 60
+JWKS_TIMEOUT = 5
+ASGI_WORKERS = 64
@@ -1,4 +1,9 @@
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions
 from google.cloud import datastore
 from flask import abort, Flask, make_response, request
 from jose import jwt
@@ -9,11 +14,24 @@ import constants
 app = Flask(__name__)
 client = datastore.Client()
 
+# pool for issuing independent storage calls concurrently
+executor = ThreadPoolExecutor(max_workers=constants.IO_WORKERS)
+
+JWKS_URL = "https://" + auth_constants.AUTH0_DOMAIN + "/.well-known/jwks.json"
+
+# cached known jwts, the time they expire, and the time they were fetched
+jwks_cache = {'jwks': None, 'expires': 0, 'fetched': 0}
+jwks_lock = threading.Lock()
+
+# transaction conflict and retry counts per route
+txn_stats = {}
+txn_stats_lock = threading.Lock()
+
 
 # create a response from content, status code, and content type header
 def create_response(content, status, content_type):
     # create a response from content and set status code and Content-Type header
-    if content:
+    if content is not None:
         res = make_response(content)
     else:
         res = make_response()
@@ -65,22 +83,29 @@ def fetch_list(item_kind):
 
 # Get filtered and paginated list of items
 def fetch_filtered_and_paginated_list(item_kind, limit=constants.MAX_LIMIT, offset=0, filter=()):
+    # start counting total items while the page is fetched
+    total = executor.submit(_count_items, item_kind, filter)
     query = client.query(kind=item_kind)
     if filter:
         query = query.add_filter(filter[0], filter[1], filter[2])
     iterator = query.fetch(limit=limit, offset=offset)
     results = list(next(iterator.pages))
-    print(results)
     output = {item_kind: results}
     # get next link and total items count
     if iterator.next_page_token:
         next_url = request.base_url + "?limit=" + str(limit) + "&offset=" + str(offset + limit)
         output['next'] = next_url
+    output['total'] = total.result()
+    return output
+
+
+# count items matching the filter with an aggregation query
+def _count_items(item_kind, filter=()):
     query = client.query(kind=item_kind)
     if filter:
         query = query.add_filter(filter[0], filter[1], filter[2])
-    output['total'] = len(list(query.fetch()))
-    return output
+    results = list(client.aggregation_query(query).count().fetch())
+    return results[0][0].value
 
 
 # add an owner to an item
@@ -108,35 +133,94 @@ def verify_pos_int(n):
     return False
 
 
-# check if the user at usr_id matches sub
-def check_auth(usr_id, sub):
-    usr_key = client.key(constants.users, usr_id)
-    usr = client.get(key=usr_key)
+# check if the user at usr_id matches sub, pass a transaction's client to read the user in it
+def check_auth(usr_id, sub, usr_client=None):
+    usr_client = usr_client or client
+    usr_key = usr_client.key(constants.users, usr_id)
+    usr = usr_client.get(key=usr_key)
     if sub != usr.get('sub'):
         abort(403, description="You are not authorized to access this resource")
 
 
+# check that the requester is an admin
+def check_admin(req):
+    token = verify_jwt(req)
+    if token.get('sub') not in auth_constants.ADMIN_SUBS:
+        abort(403, description="You are not authorized to access this resource")
+
+
+# check if the cached jwts need fetching, force asks for a rate limited refetch
+def jwks_stale(force=False):
+    now = time.monotonic()
+    if jwks_cache['jwks'] is None or now >= jwks_cache['expires']:
+        return True
+    return force and now - jwks_cache['fetched'] >= constants.JWKS_MIN_REFRESH
+
+
+# store freshly fetched jwts in the cache
+def store_jwks(jwks):
+    now = time.monotonic()
+    jwks_cache.update({'jwks': jwks, 'expires': now + constants.JWKS_TTL, 'fetched': now})
+    return jwks
+
+
+# get known jwts, one caller refreshes a stale copy while the others keep using it
+def get_jwks(force=False):
+    if not jwks_stale(force):
+        return jwks_cache['jwks']
+    # only wait for another caller's fetch if there is no copy to use yet
+    if not jwks_lock.acquire(blocking=jwks_cache['jwks'] is None):
+        return jwks_cache['jwks']
+    try:
+        if jwks_stale(force):
+            try:
+                jsonurl = urlopen(JWKS_URL, timeout=constants.JWKS_TIMEOUT)
+                store_jwks(json.loads(jsonurl.read()))
+            except (OSError, ValueError):
+                # keep using the old copy if the refresh fails
+                if jwks_cache['jwks'] is None:
+                    raise
+        return jwks_cache['jwks']
+    finally:
+        jwks_lock.release()
+
+
 # check if jwt is valid
 def verify_jwt(request):
+    token = get_token(request)
+    unverified_header = get_unverified_header(token)
+    rsa_key = find_rsa_key(get_jwks(), unverified_header.get('kid'))
+    # refetch known jwts in case the signing keys were rotated
+    if not rsa_key:
+        rsa_key = find_rsa_key(get_jwks(force=True), unverified_header.get('kid'))
+    return decode_jwt(token, rsa_key)
+
+
+# get the token from the Authorization header
+def get_token(request):
     # check for Authorization header
     if 'Authorization' in request.headers:
         auth_header = request.headers['Authorization'].split()
-        token = auth_header[1]
-    else:
-        abort(401, description="Authorization header is missing")
-    # get known jwts
-    jsonurl = urlopen("https://" + auth_constants.AUTH0_DOMAIN + "/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
-    # decode headers
+        return auth_header[1]
+    abort(401, description="Authorization header is missing")
+
+
+# decode the jwt headers without verifying them
+def get_unverified_header(token):
     try:
         unverified_header = jwt.get_unverified_header(token)
     except jwt.JWTError:
         abort(401, description="Invalid header: Use an RS256 signed JWT Access Token")
     if unverified_header["alg"] == "HS256":
         abort(401, description="Invalid header: Use an RS256 signed JWT Access Token")
+    return unverified_header
+
+
+# find the rsa key matching kid in the known jwts
+def find_rsa_key(jwks, kid):
     rsa_key = {}
     for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
+        if key["kid"] == kid:
             rsa_key = {
                 "kty": key["kty"],
                 "kid": key["kid"],
@@ -144,7 +228,11 @@ def verify_jwt(request):
                 "n": key["n"],
                 "e": key["e"]
             }
-    # decode jwt if rsa key found
+    return rsa_key
+
+
+# decode jwt if rsa key found
+def decode_jwt(token, rsa_key):
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -163,3 +251,41 @@ def verify_jwt(request):
         return payload
     else:
         abort(401, description="No RSA key in JWKS")
+
+
+# record a transaction event for a route
+def count_txn(route, event):
+    with txn_stats_lock:
+        stats = txn_stats.setdefault(route, {'commits': 0, 'conflicts': 0, 'retries': 0, 'failures': 0})
+        stats[event] += 1
+
+
+# get a copy of the transaction counts for every route
+def get_txn_stats():
+    with txn_stats_lock:
+        return {route: dict(stats) for route, stats in txn_stats.items()}
+
+
+# full jitter exponential backoff before retrying a transaction
+def txn_backoff(attempt):
+    return random.uniform(0, min(constants.TXN_MAX_BACKOFF, constants.TXN_BASE_BACKOFF * 2 ** attempt))
+
+
+# run func in a transaction on txn_client, retrying with backoff and jitter on contention
+def run_in_transaction(txn_client, route, func, *args):
+    for attempt in range(constants.TXN_MAX_ATTEMPTS):
+        try:
+            # reads and puts made with txn_client inside func join the transaction,
+            # calls through other clients do not
+            with txn_client.transaction():
+                result = func(*args)
+            count_txn(route, 'commits')
+            return result
+        except (exceptions.Conflict, exceptions.Aborted):
+            count_txn(route, 'conflicts')
+            if attempt + 1 == constants.TXN_MAX_ATTEMPTS:
+                break
+            count_txn(route, 'retries')
+            time.sleep(txn_backoff(attempt))
+    count_txn(route, 'failures')
+    abort(409, description="Request conflicted with a concurrent update, try again")
@@ -1,5 +1,6 @@
 from flask import abort, Blueprint, request
 from google.cloud import datastore
+import async_helpers
 import constants
 import helpers
 
@@ -41,7 +42,6 @@ def load_get_post():
         q_offset = int(request.args.get('offset', '0'))
         # get paginated list of loads
         results = helpers.fetch_filtered_and_paginated_list(constants.loads, limit=q_limit, offset=q_offset)
-        print(results)
         # add ids and self links
         for load in results.get('loads'):
             load = _add_ids_and_self_links(load)
@@ -112,6 +112,21 @@ def load_patch_delete(load_id):
         abort(405, description="Method Not Allowed")
 
 
+# GET /loads/ for the ASGI serving mode
+async def load_get_async():
+    # check that json response accepts json
+    helpers.check_accepts_json_res(request)
+    # get limit and offset from request arguments
+    q_limit = int(request.args.get('limit', '5'))
+    q_offset = int(request.args.get('offset', '0'))
+    # get paginated list of loads
+    results = await async_helpers.fetch_filtered_and_paginated_list(constants.loads, limit=q_limit, offset=q_offset)
+    # add ids and self links
+    for load in results.get('loads'):
+        load = _add_ids_and_self_links(load)
+    return helpers.create_response(results, 200, constants.json)
+
+
 # update load with its ids and self links
 def _add_ids_and_self_links(load):
     load.update({'id': load.id, 'self': request.url_root + constants.loads + '/' + str(load.id)})
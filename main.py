@@ -5,6 +5,7 @@ import boat
 import constants
 import helpers
 import load
+import profiler
 import requests
 import user
 
@@ -13,6 +14,8 @@ app.secret_key = auth_constants.APP_SECRET_KEY
 app.register_blueprint(boat.bp)
 app.register_blueprint(user.bp)
 app.register_blueprint(load.bp)
+app.register_blueprint(profiler.bp)
+profiler.init_app(app)
 
 oauth = OAuth(app)
 
@@ -74,12 +77,21 @@ def create_user(token):
     return usr
 
 
+# get transaction conflict and retry counts per route
+@app.route('/metrics/transactions', methods=['GET'])
+def transaction_metrics():
+    helpers.check_accepts_json_res(request)
+    helpers.check_admin(request)
+    return helpers.create_response(helpers.get_txn_stats(), 200, constants.json)
+
+
 @app.errorhandler(400)
 @app.errorhandler(401)
 @app.errorhandler(403)
 @app.errorhandler(404)
 @app.errorhandler(405)
 @app.errorhandler(406)
+@app.errorhandler(409)
 @app.errorhandler(415)
 def handle_error(e):
     return jsonify(str(e)), e.code
@@ -0,0 +1,117 @@
+import hmac
+import random
+import sys
+import threading
+import time
+from flask import abort, Blueprint, request
+import auth_constants
+import constants
+import helpers
+
+bp = Blueprint('profiler', __name__, url_prefix='/admin')
+
+# threads currently handling a profiled request, thread id -> route
+_active = {}
+# sampled stack counts, collapsed stack -> count
+_stacks = {}
+_lock = threading.Lock()
+_sampler = None
+
+
+# register the profiling hooks on the app, does nothing unless profiling is enabled
+def init_app(app):
+    if not constants.PROFILE_ENABLED:
+        return
+    app.before_request(_start_profile)
+    app.teardown_request(_stop_profile)
+
+
+# mark the current thread for sampling if the request is selected for profiling
+def _start_profile():
+    if not _selected(request):
+        return
+    # unmatched urls share one label so random paths cannot grow the stacks
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    with _lock:
+        _active[threading.get_ident()] = request.method + ' ' + rule
+    _start_sampler()
+
+
+# check if the request is sampled or carries the profiling secret
+def _selected(req):
+    value = req.headers.get(constants.PROFILE_HEADER)
+    if value and auth_constants.PROFILE_SECRET and \
+            hmac.compare_digest(value.encode(), auth_constants.PROFILE_SECRET.encode()):
+        return True
+    return random.random() < constants.PROFILE_SAMPLE_RATE
+
+
+# stop sampling the current thread
+def _stop_profile(exc=None):
+    with _lock:
+        _active.pop(threading.get_ident(), None)
+
+
+# start the background sampling thread once
+def _start_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name='profiler', daemon=True)
+            _sampler.start()
+
+
+# periodically record the stack of every thread handling a profiled request
+def _sample_loop():
+    while True:
+        time.sleep(constants.PROFILE_INTERVAL)
+        with _lock:
+            active = dict(_active)
+        if not active:
+            continue
+        frames = sys._current_frames()
+        for thread_id, route in active.items():
+            frame = frames.get(thread_id)
+            if frame is not None:
+                _record(route, frame)
+
+
+# add one sample of frame's stack under route
+def _record(route, frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(route)
+    stack = ';'.join(reversed(names))
+    with _lock:
+        _stacks[stack] = _stacks.get(stack, 0) + 1
+
+
+# label a frame with its module and qualified function name
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return module + ':' + getattr(code, 'co_qualname', code.co_name)
+
+
+# export the sampled stacks in collapsed stack format, one "stack count" line each
+def export_collapsed():
+    with _lock:
+        stacks = dict(_stacks)
+    return ''.join(stack + ' ' + str(count) + '\n' for stack, count in sorted(stacks.items()))
+
+
+@bp.route('/profile', methods=['GET', 'DELETE'])
+def profile_get_delete():
+    helpers.check_admin(request)
+    # get sampled stacks for flame graph tools
+    if request.method == 'GET':
+        return helpers.create_response(export_collapsed(), 200, 'text/plain')
+    # clear sampled stacks
+    elif request.method == 'DELETE':
+        with _lock:
+            _stacks.clear()
+        return helpers.create_response(None, 204, None)
+    else:
+        abort(405, description="Method Not Allowed")
@@ -0,0 +1,40 @@
+import os
+import sys
+import pytest
+
+# point the app's datastore clients at an unused emulator so importing them needs no credentials
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:1')
+os.environ.setdefault('DATASTORE_DATASET', 'test')
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_helpers
+import boat
+import helpers
+import load
+from fake_datastore import FakeAsyncClient, FakeClient, FakeStore
+
+
+@pytest.fixture
+def fake_store(monkeypatch):
+    monkeypatch.setattr(helpers, 'txn_stats', {})
+    return FakeStore()
+
+
+# separate fake clients for boat and helpers over one store, like the app's separate datastore clients
+@pytest.fixture
+def fake_client(fake_store, monkeypatch):
+    client = FakeClient(fake_store)
+    monkeypatch.setattr(boat, 'client', client)
+    monkeypatch.setattr(load, 'client', FakeClient(fake_store))
+    monkeypatch.setattr(helpers, 'client', FakeClient(fake_store))
+    return client
+
+
+# separate fake async clients over the same store as fake_client
+@pytest.fixture
+def fake_async_client(fake_store, monkeypatch):
+    client = FakeAsyncClient(fake_store)
+    monkeypatch.setattr(boat, 'async_client', client)
+    monkeypatch.setattr(async_helpers, 'client', FakeAsyncClient(fake_store))
+    return client
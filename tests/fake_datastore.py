@@ -0,0 +1,229 @@
+import asyncio
+import copy
+import threading
+import time
+from google.api_core import exceptions
+from google.cloud import datastore
+
+
+# thread safe in-memory entities shared by every FakeClient built on it
+class FakeStore:
+    def __init__(self):
+        self.entities = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.next_id = 1
+
+    # write entity at key, or delete it if entity is None, caller must hold the lock
+    def write(self, key, entity):
+        self.versions[key] = self.versions.get(key, 0) + 1
+        if entity is None:
+            self.entities.pop(key, None)
+        else:
+            self.entities[key] = entity
+
+    # entities of kind matching an optional (property, '=', value) filter, ordered by id
+    def query(self, kind, filter=()):
+        with self.lock:
+            found = [copy.deepcopy(entity) for key, entity in self.entities.items() if key.kind == kind and
+                     (not filter or entity.get(filter[0]) == filter[2])]
+        return sorted(found, key=lambda entity: entity.key.id)
+
+    # get the entities at keys, recording the read versions in txn if given
+    def lookup(self, keys, txn=None):
+        found = []
+        with self.lock:
+            # reads in a transaction must see one snapshot, abort if an earlier read is stale
+            if txn is not None:
+                txn.check_reads()
+            for key in keys:
+                if txn is not None and key not in txn.reads:
+                    txn.reads[key] = self.versions.get(key, 0)
+                entity = self.entities.get(key)
+                if entity is not None:
+                    found.append(copy.deepcopy(entity))
+        return found
+
+    # apply a transaction's writes, raising Aborted if anything it read has changed
+    def commit(self, txn):
+        with self.lock:
+            txn.check_reads()
+            for key, entity in txn.writes.items():
+                self.write(key, entity)
+
+
+# in-memory stand-in for the datastore client with optimistic transactions
+class FakeClient:
+    def __init__(self, store, latency=0):
+        self.store = store
+        self.latency = latency
+        self._local = threading.local()
+
+    def key(self, kind, id=None):
+        if id is None:
+            with self.store.lock:
+                id = self.store.next_id
+                self.store.next_id += 1
+        return datastore.Key(kind, id, project='test')
+
+    def get(self, key):
+        found = self.get_multi([key])
+        return found[0] if found else None
+
+    def get_multi(self, keys):
+        time.sleep(self.latency)
+        return self.store.lookup(keys, getattr(self._local, 'txn', None))
+
+    def put(self, entity):
+        txn = getattr(self._local, 'txn', None)
+        if txn is not None:
+            txn.writes[entity.key] = copy.deepcopy(entity)
+            return
+        with self.store.lock:
+            self.store.write(entity.key, copy.deepcopy(entity))
+
+    def delete(self, key):
+        txn = getattr(self._local, 'txn', None)
+        if txn is not None:
+            txn.writes[key] = None
+            return
+        with self.store.lock:
+            self.store.write(key, None)
+
+    # create an entity of kind with content outside any transaction
+    def create(self, kind, content):
+        entity = datastore.Entity(key=self.key(kind))
+        entity.update(content)
+        self.put(entity)
+        return entity
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def query(self, kind):
+        return FakeQuery(self, kind)
+
+    def aggregation_query(self, query):
+        return FakeAggregationQuery(query)
+
+
+# transaction that aborts on commit if anything it read has changed since
+class FakeTransaction:
+    def __init__(self, client):
+        self._client = client
+        self._store = client.store
+        self.reads = {}
+        self.writes = {}
+
+    # raise Aborted if anything read has been written since, caller must hold the store lock
+    def check_reads(self):
+        for key, version in self.reads.items():
+            if self._store.versions.get(key, 0) != version:
+                raise exceptions.Aborted("Transaction conflict")
+
+    def __enter__(self):
+        self._client._local.txn = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._client._local.txn = None
+        if exc_type is None:
+            time.sleep(self._client.latency)
+            self._store.commit(self)
+        return False
+
+
+# query supporting the single equality filter and first page fetch the app uses
+class FakeQuery:
+    def __init__(self, client, kind):
+        self._client = client
+        self.kind = kind
+        self.filter = ()
+
+    def add_filter(self, property_name, operator, value):
+        self.filter = (property_name, operator, value)
+        return self
+
+    def fetch(self, limit=None, offset=0):
+        time.sleep(self._client.latency)
+        entities = self._client.store.query(self.kind, self.filter)
+        end = len(entities) if limit is None else offset + limit
+        return FakeIterator(entities[offset:end], end < len(entities))
+
+
+class FakeIterator:
+    def __init__(self, results, more):
+        self.pages = iter([results])
+        self.next_page_token = b'next' if more else None
+        self._results = results
+
+    def __iter__(self):
+        return iter(self._results)
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def count(self):
+        return self
+
+    def fetch(self):
+        total = len(list(self._query.fetch()))
+        return iter([[datastore.aggregation.AggregationResult('count', total)]])
+
+
+# async stand-in for async_storage.AsyncClient over a FakeStore
+class FakeAsyncClient:
+    def __init__(self, store, latency=0):
+        self.store = store
+        self.latency = latency
+
+    def key(self, kind, id):
+        return datastore.Key(kind, id, project='test')
+
+    async def get_multi(self, keys, transaction=None):
+        await asyncio.sleep(self.latency)
+        return self.store.lookup(keys, transaction)
+
+    async def get(self, key, transaction=None):
+        found = await self.get_multi([key], transaction)
+        return found[0] if found else None
+
+    async def query(self, kind, filter=(), limit=None, offset=0):
+        await asyncio.sleep(self.latency)
+        entities = self.store.query(kind, filter)
+        end = len(entities) if limit is None else offset + limit
+        return entities[offset:end], end < len(entities)
+
+    async def count(self, kind, filter=()):
+        await asyncio.sleep(self.latency)
+        return len(self.store.query(kind, filter))
+
+    def transaction(self):
+        return FakeAsyncTransaction(self)
+
+
+# async version of FakeTransaction, reads and writes go through it explicitly
+class FakeAsyncTransaction(FakeTransaction):
+    async def __aenter__(self):
+        await asyncio.sleep(self._client.latency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await asyncio.sleep(self._client.latency)
+            self._store.commit(self)
+        return False
+
+    async def get_multi(self, keys):
+        return await self._client.get_multi(keys, self)
+
+    async def get(self, key):
+        return await self._client.get(key, self)
+
+    def put(self, entity):
+        self.writes[entity.key] = copy.deepcopy(entity)
+
+    def delete(self, key):
+        self.writes[key] = None
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+import uvicorn
+import async_helpers
+import asgi
+import boat
+import constants
+import helpers
+import main
+
+THREADS = 32
+
+
+@pytest.fixture(autouse=True)
+def login(monkeypatch):
+    async def verify_jwt(req):
+        return {'sub': 'owner-sub'}
+    monkeypatch.setattr(async_helpers, 'verify_jwt', verify_jwt)
+    monkeypatch.setattr(helpers, 'verify_jwt', lambda req: {'sub': 'owner-sub'})
+
+
+@pytest.fixture
+def owner(fake_client, fake_async_client):
+    return fake_client.create(constants.users, {'name': 'owner', 'sub': 'owner-sub'})
+
+
+def _new_boat(client, owner_id):
+    return client.create(constants.boats, {'name': 'b', 'type': 't', 'length': 1, 'owner': owner_id, 'loads': []})
+
+
+def _new_load(client):
+    return client.create(constants.loads, {'item': 'i', 'volume': 1, 'weight': 1, 'boat': None})
+
+
+# send one request to the ASGI app and return its status and body
+async def _request(method, path, query=b''):
+    scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query,
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+             'headers': [(b'accept', constants.json.encode())]}
+    messages = [{'type': 'http.request', 'body': b''}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+    await asgi.asgi_app(scope, receive, send)
+    return sent[0]['status'], sent[1]['body']
+
+
+def _call(method, path, query=b''):
+    return asyncio.run(_request(method, path, query))
+
+
+def test_list_boats_runs_async(fake_client, owner, monkeypatch):
+    monkeypatch.setattr(helpers, 'fetch_filtered_and_paginated_list', None)
+    for owner_id in [owner.id] * 7 + [owner.id + 100] * 3:
+        _new_boat(fake_client, owner_id)
+    status, body = _call('GET', '/boats', b'limit=5')
+    results = json.loads(body)
+    assert status == 200
+    assert len(results['boats']) == 5
+    assert results['total'] == 7
+    assert results['next'] == 'http://testserver/boats?limit=5&offset=5'
+
+
+def test_list_loads_runs_async(fake_client, owner):
+    for _ in range(3):
+        _new_load(fake_client)
+    status, body = _call('GET', '/loads/')
+    assert status == 200
+    assert json.loads(body)['total'] == 3
+    assert 'next' not in json.loads(body)
+
+
+def test_attach_and_detach_run_async(fake_client, owner, monkeypatch):
+    monkeypatch.setattr(boat, '_attach_load', None)
+    monkeypatch.setattr(boat, '_detach_load', None)
+    b = _new_boat(fake_client, owner.id)
+    load = _new_load(fake_client)
+    assert _call('PATCH', '/boats/%d/%d' % (b.id, load.id)) == (204, b'')
+    assert fake_client.get(load.key)['boat'] == {'id': b.id}
+    assert fake_client.get(b.key)['loads'] == [{'id': load.id}]
+    assert _call('DELETE', '/boats/%d/%d' % (b.id, load.id)) == (204, b'')
+    assert fake_client.get(load.key)['boat'] is None
+    assert fake_client.get(b.key)['loads'] == []
+    assert helpers.get_txn_stats()['attach']['commits'] == 1
+    assert helpers.get_txn_stats()['detach']['commits'] == 1
+
+
+@pytest.mark.parametrize('method, path', [('PATCH', '/boats/999/1'), ('DELETE', '/boats/999/1')])
+def test_async_errors_match_wsgi(fake_client, owner, method, path):
+    status, body = _call(method, path)
+    res = main.app.test_client().open(path, method=method)
+    assert status == res.status_code == 404
+    assert body == res.get_data()
+
+
+def test_parallel_async_attach_same_load_has_one_winner(fake_client, fake_async_client, owner):
+    fake_async_client.latency = 0.001
+    boats = [_new_boat(fake_client, owner.id) for _ in range(THREADS)]
+    load = _new_load(fake_client)
+
+    async def attach_all():
+        return await asyncio.gather(*[_request('PATCH', '/boats/%d/%d' % (b.id, load.id)) for b in boats])
+    statuses = [status for status, _ in asyncio.run(attach_all())]
+    assert statuses.count(204) == 1
+    assert statuses.count(403) == THREADS - 1
+    winner = boats[statuses.index(204)]
+    assert fake_client.get(load.key)['boat'] == {'id': winner.id}
+    assert sum(len(fake_client.get(b.key)['loads']) for b in boats) == 1
+
+
+def test_in_flight_requests_share_event_loop(fake_client, fake_async_client, owner, monkeypatch):
+    latency = 0.05
+    fake_async_client.latency = latency
+    monkeypatch.setattr(async_helpers.client, 'latency', latency)
+    # with one thread and the same latency the WSGI fallback could only serve requests one after another
+    monkeypatch.setattr(helpers.client, 'latency', latency)
+    monkeypatch.setattr(asgi, 'executor', ThreadPoolExecutor(max_workers=1))
+    _new_boat(fake_client, owner.id)
+
+    async def list_all():
+        return await asyncio.gather(*[_request('GET', '/boats') for _ in range(50)])
+    start = time.perf_counter()
+    statuses = [status for status, _ in asyncio.run(list_all())]
+    elapsed = time.perf_counter() - start
+    assert statuses == [200] * 50
+    # each request waits for two round trips, served one after another they would take 50 times as long
+    assert elapsed < 10 * 2 * latency
+
+
+def test_other_routes_fall_back_to_wsgi(fake_client, owner):
+    load = _new_load(fake_client)
+    assert _call('DELETE', '/loads/%d' % load.id) == (204, b'')
+    assert fake_client.get(load.key) is None
+    assert _call('GET', '/no/such/path')[0] == 404
+
+
+def test_uvicorn_serves_asgi_app(fake_client, owner):
+    _new_load(fake_client)
+    server = uvicorn.Server(uvicorn.Config(asgi.asgi_app, host='127.0.0.1', port=0, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        req = urllib.request.Request('http://127.0.0.1:%d/loads/' % port, headers={'Accept': constants.json})
+        with urllib.request.urlopen(req, timeout=5) as res:
+            assert res.status == 200
+            assert json.loads(res.read())['total'] == 1
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+@pytest.fixture
+def jwks_server(monkeypatch):
+    server = {'jwks': {'keys': [{'kid': 'new'}]}, 'fetches': 0}
+
+    async def handler(request):
+        server['fetches'] += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=server['jwks'])
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(async_helpers.httpx, 'AsyncClient',
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+    monkeypatch.setattr(helpers, 'jwks_cache', {'jwks': None, 'expires': 0, 'fetched': 0})
+    monkeypatch.setattr(async_helpers, '_jwks_refresh', {'task': None})
+    return server
+
+
+def test_async_jwks_fetched_once_for_concurrent_callers(jwks_server):
+    async def get_all():
+        return await asyncio.gather(*[async_helpers.get_jwks() for _ in range(10)])
+    assert asyncio.run(get_all()) == [{'keys': [{'kid': 'new'}]}] * 10
+    assert jwks_server['fetches'] == 1
+
+
+def test_async_stale_jwks_used_while_refreshing(jwks_server):
+    helpers.store_jwks({'keys': [{'kid': 'old'}]})
+    helpers.jwks_cache['expires'] = 0
+
+    async def get_twice():
+        first = await async_helpers.get_jwks()
+        await async_helpers._jwks_refresh['task']
+        return first, await async_helpers.get_jwks()
+    assert asyncio.run(get_twice()) == ({'keys': [{'kid': 'old'}]}, {'keys': [{'kid': 'new'}]})
+    assert jwks_server['fetches'] == 1
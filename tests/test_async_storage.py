@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from google.api_core import exceptions
+from google.cloud import datastore
+from google.cloud.datastore import helpers as ds_helpers
+from google.cloud.datastore_v1.types import aggregation_result as aggregation_pb
+from google.cloud.datastore_v1.types import datastore as datastore_pb
+from google.cloud.datastore_v1.types import entity as entity_pb
+from google.cloud.datastore_v1.types import query as query_pb
+import async_storage
+
+
+# records requests and answers them with queued responses
+class StubApi:
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    async def _call(self, request):
+        self.requests.append(request)
+        return self.responses.pop(0)
+
+    lookup = run_query = run_aggregation_query = begin_transaction = commit = rollback = _call
+
+
+@pytest.fixture
+def client():
+    client = async_storage.AsyncClient(project='test')
+    client._api = StubApi()
+    return client
+
+
+def _entity_pb(kind, id, **props):
+    entity = datastore.Entity(key=datastore.Key(kind, id, project='test'))
+    entity.update(props)
+    return ds_helpers.entity_to_protobuf(entity)
+
+
+def test_query_builds_filter_and_reads_page(client):
+    batch = query_pb.QueryResultBatch(
+        entity_results=[query_pb.EntityResult(entity=_entity_pb('boats', 1, owner=7))],
+        more_results=query_pb.QueryResultBatch.MoreResultsType.MORE_RESULTS_AFTER_LIMIT)
+    client.api.responses.append(datastore_pb.RunQueryResponse(batch=batch))
+    entities, more = asyncio.run(client.query('boats', ('owner', '=', 7), limit=5, offset=10))
+    assert [(e.key.id, e['owner']) for e in entities] == [(1, 7)]
+    assert more is True
+    query = client.api.requests[0].query
+    assert query.kind[0].name == 'boats'
+    assert query.filter.property_filter.property.name == 'owner'
+    assert query.filter.property_filter.value.integer_value == 7
+    assert query.limit == 5
+    assert query.offset == 10
+
+
+def test_query_without_more_results(client):
+    batch = query_pb.QueryResultBatch(more_results=query_pb.QueryResultBatch.MoreResultsType.NO_MORE_RESULTS)
+    client.api.responses.append(datastore_pb.RunQueryResponse(batch=batch))
+    assert asyncio.run(client.query('users', ('sub', '=', 'abc'))) == ([], False)
+    assert client.api.requests[0].query.filter.property_filter.value.string_value == 'abc'
+
+
+def test_count_reads_aggregation_result(client):
+    result = aggregation_pb.AggregationResult(aggregate_properties={'total': entity_pb.Value(integer_value=7)})
+    client.api.responses.append(datastore_pb.RunAggregationQueryResponse(
+        batch=aggregation_pb.AggregationResultBatch(aggregation_results=[result])))
+    assert asyncio.run(client.count('boats', ('owner', '=', 1))) == 7
+    aggregation = client.api.requests[0].aggregation_query
+    assert aggregation.nested_query.kind[0].name == 'boats'
+    assert aggregation.aggregations[0].alias == 'total'
+
+
+def test_get_multi_follows_deferred_keys(client):
+    boat, load = _entity_pb('boats', 1), _entity_pb('loads', 2)
+    client.api.responses.append(datastore_pb.LookupResponse(found=[query_pb.EntityResult(entity=boat)],
+                                                            deferred=[load.key]))
+    client.api.responses.append(datastore_pb.LookupResponse(found=[query_pb.EntityResult(entity=load)]))
+    found = asyncio.run(client.get_multi([client.key('boats', 1), client.key('loads', 2)]))
+    assert [e.key for e in found] == [client.key('boats', 1), client.key('loads', 2)]
+    assert len(client.api.requests[1].keys) == 1
+
+
+def test_transaction_commits_writes(client):
+    client.api.responses += [datastore_pb.BeginTransactionResponse(transaction=b'txn'),
+                             datastore_pb.LookupResponse(), datastore_pb.CommitResponse()]
+
+    async def run():
+        async with client.transaction() as txn:
+            await txn.get(client.key('boats', 1))
+            txn.put(datastore.Entity(key=client.key('boats', 1)))
+            txn.delete(client.key('loads', 2))
+    asyncio.run(run())
+    lookup, commit = client.api.requests[1], client.api.requests[2]
+    assert lookup.read_options.transaction == b'txn'
+    assert commit.transaction == b'txn'
+    assert commit.mode == datastore_pb.CommitRequest.Mode.TRANSACTIONAL
+    assert commit.mutations[0].upsert.key.path[0].id == 1
+    assert commit.mutations[1].delete.path[0].id == 2
+
+
+def test_transaction_rolls_back_on_error(client):
+    client.api.responses += [datastore_pb.BeginTransactionResponse(transaction=b'txn'),
+                             datastore_pb.RollbackResponse()]
+
+    async def run():
+        async with client.transaction():
+            raise exceptions.NotFound("missing")
+    with pytest.raises(exceptions.NotFound):
+        asyncio.run(run())
+    assert client.api.requests[1].transaction == b'txn'
+    assert isinstance(client.api.requests[1], datastore_pb.RollbackRequest)
@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from werkzeug.exceptions import HTTPException
+import boat
+import constants
+import helpers
+
+THREADS = 32
+
+
+@pytest.fixture
+def owner(fake_client):
+    usr = fake_client.create(constants.users, {'name': 'owner', 'sub': 'owner-sub'})
+    return usr
+
+
+def _new_boat(client, owner):
+    return client.create(constants.boats, {'name': 'b', 'type': 't', 'length': 1, 'owner': owner.id, 'loads': []})
+
+
+def _new_load(client):
+    return client.create(constants.loads, {'item': 'i', 'volume': 1, 'weight': 1, 'boat': None})
+
+
+# run func with each set of args in parallel, returning the status code of each call
+def _run_parallel(func, args_list):
+    def call(args):
+        try:
+            func(*args)
+            return 204
+        except HTTPException as e:
+            return e.code
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(call, args_list))
+
+
+def _attach(boat_id, load_id):
+    helpers.run_in_transaction(boat.client, 'attach', boat._attach_load, boat_id, load_id, 'owner-sub')
+
+
+def _check_stats(route, commits):
+    stats = helpers.get_txn_stats()[route]
+    assert stats['commits'] == commits
+    assert stats['conflicts'] == stats['retries'] + stats['failures']
+    assert stats['failures'] == 0
+
+
+def test_parallel_attach_same_load_has_one_winner(fake_client, owner):
+    boats = [_new_boat(fake_client, owner) for _ in range(THREADS)]
+    load = _new_load(fake_client)
+    codes = _run_parallel(_attach, [(b.id, load.id) for b in boats])
+    assert codes.count(204) == 1
+    assert codes.count(403) == THREADS - 1
+    winner = boats[codes.index(204)]
+    assert fake_client.get(load.key)['boat'] == {'id': winner.id}
+    for b in boats:
+        expected = [{'id': load.id}] if b.id == winner.id else []
+        assert fake_client.get(b.key)['loads'] == expected
+    _check_stats('attach', 1)
+
+
+def test_parallel_attach_many_loads_to_one_boat(fake_client, owner):
+    b = _new_boat(fake_client, owner)
+    loads = [_new_load(fake_client) for _ in range(THREADS * 4)]
+    codes = _run_parallel(_attach, [(b.id, l.id) for l in loads])
+    assert codes == [204] * len(loads)
+    assert sorted(l['id'] for l in fake_client.get(b.key)['loads']) == sorted(l.id for l in loads)
+    for l in loads:
+        assert fake_client.get(l.key)['boat'] == {'id': b.id}
+    _check_stats('attach', len(loads))
+
+
+def test_replace_boat_does_not_lose_concurrent_attach(fake_client, owner):
+    b = _new_boat(fake_client, owner)
+    loads = [_new_load(fake_client) for _ in range(THREADS)]
+    content = {'name': 'new', 'type': 't', 'length': 2}
+
+    def replace():
+        helpers.run_in_transaction(boat.client, 'replace_boat', boat._replace_boat, b.id, content, 'owner-sub')
+    args_list = [(b.id, l.id) for l in loads] + [()] * 4
+    codes = _run_parallel(lambda *args: _attach(*args) if args else replace(), args_list)
+    assert codes == [204] * len(args_list)
+    # every load points at the boat only if the boat lists it
+    on_boat = {l['id'] for l in fake_client.get(b.key)['loads']}
+    for l in loads:
+        assert (fake_client.get(l.key)['boat'] is not None) == (l.id in on_boat)
+
+
+def test_failed_transaction_is_counted_and_returns_409(fake_client, owner, monkeypatch):
+    monkeypatch.setattr(constants, 'TXN_MAX_ATTEMPTS', 3)
+    b = _new_boat(fake_client, owner)
+    load = _new_load(fake_client)
+
+    # change the boat behind the transaction's back so every commit conflicts
+    def conflicting(boat_id, load_id, sub):
+        boat._attach_load(boat_id, load_id, sub)
+        with fake_client.store.lock:
+            fake_client.store.write(b.key, fake_client.store.entities[b.key])
+    with pytest.raises(HTTPException) as e:
+        helpers.run_in_transaction(fake_client, 'attach', conflicting, b.id, load.id, 'owner-sub')
+    assert e.value.code == 409
+    assert helpers.get_txn_stats()['attach'] == {'commits': 0, 'conflicts': 3, 'retries': 2, 'failures': 1}
+    assert fake_client.get(load.key)['boat'] is None
+
+
+def test_owner_check_reads_user_in_transaction(fake_client, owner, monkeypatch):
+    monkeypatch.setattr(constants, 'TXN_MAX_ATTEMPTS', 2)
+    b = _new_boat(fake_client, owner)
+    load = _new_load(fake_client)
+
+    # change the owner after the auth check, the transaction must see it as a conflict
+    def owner_changes(boat_id, load_id, sub):
+        boat._attach_load(boat_id, load_id, sub)
+        with fake_client.store.lock:
+            fake_client.store.write(owner.key, fake_client.store.entities[owner.key])
+    with pytest.raises(HTTPException) as e:
+        helpers.run_in_transaction(fake_client, 'attach', owner_changes, b.id, load.id, 'owner-sub')
+    assert e.value.code == 409
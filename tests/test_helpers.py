@@ -0,0 +1,111 @@
+import base64
+import io
+import json
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from werkzeug.exceptions import HTTPException
+import auth_constants
+import constants
+import helpers
+import main
+
+
+def _b64(n):
+    return base64.urlsafe_b64encode(n.to_bytes((n.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+# make an rsa signing key and its jwks entry
+def _signing_key(kid):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    numbers = key.public_key().public_numbers()
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    return pem, {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': _b64(numbers.n), 'e': _b64(numbers.e)}
+
+
+def _token(pem, kid, sub='user-sub'):
+    claims = {'sub': sub, 'aud': auth_constants.AUTH0_CLIENT_ID, 'iss': 'https://' + auth_constants.AUTH0_DOMAIN + '/',
+              'exp': int(time.time()) + 60}
+    return jwt.encode(claims, pem, algorithm='RS256', headers={'kid': kid})
+
+
+class _Request:
+    def __init__(self, token):
+        self.headers = {'Authorization': 'Bearer ' + token}
+
+
+@pytest.fixture
+def jwks_server(monkeypatch):
+    server = {'jwks': {'keys': []}, 'fetches': [], 'fail': False}
+
+    def fake_urlopen(url, timeout=None):
+        server['fetches'].append(timeout)
+        if server['fail']:
+            raise OSError("connection refused")
+        return io.BytesIO(json.dumps(server['jwks']).encode())
+    monkeypatch.setattr(helpers, 'urlopen', fake_urlopen)
+    monkeypatch.setattr(helpers, 'jwks_cache', {'jwks': None, 'expires': 0, 'fetched': 0})
+    return server
+
+
+def test_jwks_cached_within_ttl(jwks_server):
+    helpers.get_jwks()
+    helpers.get_jwks()
+    assert jwks_server['fetches'] == [constants.JWKS_TIMEOUT]
+
+
+def test_jwks_fetched_again_after_ttl(jwks_server, monkeypatch):
+    monkeypatch.setattr(constants, 'JWKS_TTL', -1)
+    helpers.get_jwks()
+    jwks_server['jwks'] = {'keys': [{'kid': 'new'}]}
+    assert helpers.get_jwks() == {'keys': [{'kid': 'new'}]}
+    assert len(jwks_server['fetches']) == 2
+
+
+def test_stale_jwks_used_while_another_caller_refreshes(jwks_server):
+    helpers.store_jwks({'keys': [{'kid': 'old'}]})
+    helpers.jwks_cache['expires'] = 0
+    with helpers.jwks_lock:
+        assert helpers.get_jwks() == {'keys': [{'kid': 'old'}]}
+    assert jwks_server['fetches'] == []
+
+
+def test_failed_refresh_keeps_old_jwks(jwks_server):
+    helpers.store_jwks({'keys': [{'kid': 'old'}]})
+    helpers.jwks_cache['expires'] = 0
+    jwks_server['fail'] = True
+    assert helpers.get_jwks() == {'keys': [{'kid': 'old'}]}
+
+
+def test_rotated_key_refetched_once(jwks_server):
+    old_pem, old_jwk = _signing_key('old')
+    new_pem, new_jwk = _signing_key('new')
+    helpers.store_jwks({'keys': [old_jwk]})
+    helpers.jwks_cache['fetched'] -= constants.JWKS_MIN_REFRESH
+    jwks_server['jwks'] = {'keys': [old_jwk, new_jwk]}
+    assert helpers.verify_jwt(_Request(_token(new_pem, 'new')))['sub'] == 'user-sub'
+    assert len(jwks_server['fetches']) == 1
+    # unknown kids right after a refetch do not trigger another one
+    with pytest.raises(HTTPException) as e:
+        helpers.verify_jwt(_Request(_token(new_pem, 'unknown')))
+    assert e.value.code == 401
+    assert len(jwks_server['fetches']) == 1
+
+
+@pytest.mark.parametrize('offset, count, next_url', [
+    (0, 5, 'http://localhost/boats?limit=5&offset=5'),
+    (5, 2, None),
+])
+def test_fetch_filtered_and_paginated_list(fake_client, offset, count, next_url):
+    for owner in [1] * 7 + [2] * 3:
+        fake_client.create(constants.boats, {'owner': owner})
+    with main.app.test_request_context('/boats'):
+        output = helpers.fetch_filtered_and_paginated_list(constants.boats, limit=5, offset=offset,
+                                                           filter=('owner', '=', 1))
+    assert len(output['boats']) == count
+    assert all(b['owner'] == 1 for b in output['boats'])
+    assert output.get('next') == next_url
+    assert output['total'] == 7
@@ -0,0 +1,84 @@
+import sys
+import pytest
+import auth_constants
+import constants
+import helpers
+import main
+import profiler
+
+
+@pytest.fixture(autouse=True)
+def profiler_state(monkeypatch):
+    monkeypatch.setattr(profiler, '_stacks', {})
+    monkeypatch.setattr(profiler, '_active', {})
+    monkeypatch.setattr(profiler, '_start_sampler', lambda: None)
+    monkeypatch.setattr(auth_constants, 'PROFILE_SECRET', 'secret')
+    monkeypatch.setattr(auth_constants, 'ADMIN_SUBS', ['admin-sub'])
+    monkeypatch.setattr(constants, 'PROFILE_SAMPLE_RATE', 0.0)
+
+
+@pytest.fixture
+def login(monkeypatch):
+    def set_sub(sub):
+        monkeypatch.setattr(helpers, 'verify_jwt', lambda req: {'sub': sub})
+    return set_sub
+
+
+def test_record_exports_collapsed_line():
+    def inner():
+        return sys._getframe()
+    frame = inner()
+    profiler._record('GET /boats', frame)
+    profiler._record('GET /boats', frame)
+    lines = profiler.export_collapsed().splitlines()
+    assert len(lines) == 1
+    stack, count = lines[0].rsplit(' ', 1)
+    assert count == '2'
+    assert stack.startswith('GET /boats;')
+    assert stack.endswith(';test_profiler:test_record_exports_collapsed_line.<locals>.inner')
+
+
+@pytest.mark.parametrize('headers, rate, expected', [
+    ({}, 0.0, False),
+    ({}, 1.0, True),
+    ({constants.PROFILE_HEADER: 'secret'}, 0.0, True),
+    ({constants.PROFILE_HEADER: 'false'}, 0.0, False),
+    ({constants.PROFILE_HEADER: ''}, 0.0, False),
+    ({constants.PROFILE_HEADER: 'café'}, 0.0, False),
+])
+def test_selection(monkeypatch, headers, rate, expected):
+    monkeypatch.setattr(constants, 'PROFILE_SAMPLE_RATE', rate)
+    with main.app.test_request_context('/boats', headers=headers) as ctx:
+        assert profiler._selected(ctx.request) is expected
+
+
+def test_header_ignored_without_secret(monkeypatch):
+    monkeypatch.setattr(auth_constants, 'PROFILE_SECRET', '')
+    with main.app.test_request_context('/boats', headers={constants.PROFILE_HEADER: ''}) as ctx:
+        assert profiler._selected(ctx.request) is False
+
+
+def test_unmatched_url_uses_fixed_label():
+    with main.app.test_request_context('/no/such/path', headers={constants.PROFILE_HEADER: 'secret'}):
+        profiler._start_profile()
+        assert list(profiler._active.values()) == ['GET <unmatched>']
+        profiler._stop_profile()
+    assert profiler._active == {}
+
+
+def test_profile_requires_admin(login):
+    login('user-sub')
+    res = main.app.test_client().get('/admin/profile')
+    assert res.status_code == 403
+
+
+def test_profile_get_and_delete(login):
+    login('admin-sub')
+    profiler._stacks['GET /boats;main:f'] = 3
+    client = main.app.test_client()
+    res = client.get('/admin/profile')
+    assert res.status_code == 200
+    assert res.get_data(as_text=True) == 'GET /boats;main:f 3\n'
+    res = client.delete('/admin/profile')
+    assert res.status_code == 204
+    assert profiler.export_collapsed() == ''